@@ -1,19 +1,36 @@
 import os
 
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
 
-from app.models.dto import UploadRunRequest, UploadRunResponse
-from app.services import csv_service, mapping_service, sql_service
+from app.models.dto import UploadRunRequest, UploadRunResponse, UploadStatusResponse
+from app.services import csv_service, mapping_service, outbox_service, sql_service
 
 router = APIRouter()
 
 
+def _deferred_response(job: dict, rejects_url: str | None = None) -> UploadRunResponse:
+    # A repeated file_id returns the existing job, which may already be delivered or failed.
+    status = "queued" if job["status"] == outbox_service.STATUS_PENDING else job["status"]
+    return UploadRunResponse(
+        status=status,
+        rows_inserted=job["rows_inserted"],
+        rows_queued=job["rows_queued"],
+        rows_rejected=job["rows_rejected"],
+        rejects_url=rejects_url,
+        message=job["last_error"],
+    )
+
+
 @router.post("/upload/run", response_model=UploadRunResponse)
 def run_upload(request: UploadRunRequest):
     upload_dir = csv_service.get_upload_dir()
     file_path = os.path.join(upload_dir, f"{request.file_id}.csv")
     if not os.path.exists(file_path):
-        raise HTTPException(status_code=404, detail="file_id not found")
+        job = outbox_service.get_job(request.file_id) if request.deferred else None
+        if job is None:
+            raise HTTPException(status_code=404, detail="file_id not found")
+        return _deferred_response(job)
 
     if not request.table:
         raise HTTPException(status_code=400, detail="table is required")
@@ -26,12 +43,37 @@ def run_upload(request: UploadRunRequest):
 
     mappings = mapping_service.validate_mappings(csv_columns=csv_columns, mappings=[m.model_dump() for m in request.mappings])
 
+    policy = request.error_policy
+    rejects_path = None
+    if policy and (policy.max_rejects is not None or policy.max_reject_ratio is not None):
+        rejects_path = csv_service.get_rejects_path(request.file_id)
+
+    max_rejects = policy.max_rejects if policy else None
+    max_reject_ratio = policy.max_reject_ratio if policy else None
+    bulk_load = request.bulk_load.model_dump() if request.bulk_load else None
+
     try:
-        rows_inserted = sql_service.insert_csv(
-            file_path=file_path,
-            table=request.table,
-            mappings=mappings,
-        )
+        if request.deferred:
+            result = outbox_service.enqueue_csv(
+                file_id=request.file_id,
+                file_path=file_path,
+                table=request.table,
+                mappings=mappings,
+                max_rejects=max_rejects,
+                max_reject_ratio=max_reject_ratio,
+                rejects_path=rejects_path,
+                bulk_load=bulk_load,
+            )
+        else:
+            result = sql_service.insert_csv(
+                file_path=file_path,
+                table=request.table,
+                mappings=mappings,
+                max_rejects=max_rejects,
+                max_reject_ratio=max_reject_ratio,
+                rejects_path=rejects_path,
+                bulk_load=bulk_load,
+            )
     except sql_service.ConversionError as exc:
         raise HTTPException(
             status_code=400,
@@ -53,4 +95,50 @@ def run_upload(request: UploadRunRequest):
     except OSError:
         pass
 
-    return UploadRunResponse(status="success", rows_inserted=rows_inserted)
+    rejects_url = None
+    if rejects_path and result["rows_rejected"]:
+        rejects_url = f"/api/upload/{request.file_id}/rejects"
+
+    if request.deferred:
+        return _deferred_response(result, rejects_url)
+
+    return UploadRunResponse(
+        status="success",
+        rows_inserted=result["rows_inserted"],
+        rows_rejected=result["rows_rejected"],
+        rejects_url=rejects_url,
+    )
+
+
+@router.get("/upload/{file_id}/status", response_model=UploadStatusResponse)
+def upload_status(file_id: str):
+    job = outbox_service.get_job(file_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No queued upload for file_id")
+    return UploadStatusResponse(**job)
+
+
+@router.post("/upload/{file_id}/retry", response_model=UploadStatusResponse)
+def retry_upload(file_id: str):
+    if outbox_service.get_job(file_id) is None:
+        raise HTTPException(status_code=404, detail="No queued upload for file_id")
+    if not outbox_service.requeue_job(file_id):
+        raise HTTPException(status_code=409, detail="Only failed uploads can be retried")
+    return UploadStatusResponse(**outbox_service.get_job(file_id))
+
+
+@router.get("/upload/{file_id}/rejects")
+def download_rejects(file_id: str):
+    rejects_path = csv_service.get_rejects_path(file_id)
+    if not os.path.exists(rejects_path):
+        raise HTTPException(status_code=404, detail="No rejects file for file_id")
+    return FileResponse(rejects_path, media_type="text/csv", filename=f"{file_id}.rejects.csv")
+
+
+@router.delete("/upload/{file_id}/rejects")
+def delete_rejects(file_id: str):
+    rejects_path = csv_service.get_rejects_path(file_id)
+    if not os.path.exists(rejects_path):
+        raise HTTPException(status_code=404, detail="No rejects file for file_id")
+    os.remove(rejects_path)
+    return {"status": "deleted"}
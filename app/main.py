@@ -1,5 +1,6 @@
 import logging
 import os
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
@@ -9,6 +10,7 @@ from fastapi.staticfiles import StaticFiles
 from app.api.csv_routes import router as csv_router
 from app.api.schema_routes import router as schema_router
 from app.api.upload_routes import router as upload_router
+from app.services import outbox_service
 
 load_dotenv()
 
@@ -20,7 +22,15 @@ logging.basicConfig(
 APP_DIR = os.path.dirname(__file__)
 STATIC_DIR = os.path.join(APP_DIR, "static")
 
-app = FastAPI(title="CSV to SQL Server Uploader", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    outbox_service.start_sender()
+    yield
+    outbox_service.stop_sender()
+
+
+app = FastAPI(title="CSV to SQL Server Uploader", version="0.1.0", lifespan=lifespan)
 
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
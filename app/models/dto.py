@@ -31,14 +31,42 @@ class MappingItem(BaseModel):
     target_type: str = Field(..., min_length=1)
 
 
+class ErrorPolicy(BaseModel):
+    max_rejects: int | None = Field(None, ge=0)
+    max_reject_ratio: float | None = Field(None, ge=0, le=1)
+
+
+class BulkLoadProfile(BaseModel):
+    tablock: bool = False
+    disable_indexes: bool = False
+    heap_staging: bool = False
+
+
 class UploadRunRequest(BaseModel):
     file_id: str
     table: str
     mappings: list[MappingItem]
+    error_policy: ErrorPolicy | None = None
+    bulk_load: BulkLoadProfile | None = None
+    deferred: bool = False
 
 
 class UploadRunResponse(BaseModel):
     status: str
     rows_inserted: int | None = None
+    rows_rejected: int | None = None
+    rows_queued: int | None = None
+    rejects_url: str | None = None
     message: str | None = None
     details: list[str] | None = None
+
+
+class UploadStatusResponse(BaseModel):
+    file_id: str
+    table: str
+    status: str
+    rows_queued: int
+    rows_rejected: int
+    rows_inserted: int | None = None
+    attempts: int
+    last_error: str | None = None
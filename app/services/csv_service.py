@@ -24,6 +24,14 @@ def get_upload_dir() -> str:
     return upload_dir
 
 
+def get_rejects_path(file_id: str) -> str:
+    try:
+        file_id = str(uuid.UUID(file_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid file_id")
+    return os.path.join(get_upload_dir(), f"{file_id}.rejects.csv")
+
+
 async def save_upload(upload_file: UploadFile) -> dict:
     if not upload_file.filename or not upload_file.filename.lower().endswith(".csv"):
         raise HTTPException(status_code=400, detail="Only .csv files are allowed")
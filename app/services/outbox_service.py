@@ -0,0 +1,358 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+from app.services import sql_service
+
+logger = logging.getLogger(__name__)
+
+STATUS_STAGING = "staging"
+STATUS_PENDING = "pending"
+STATUS_DELIVERED = "delivered"
+STATUS_FAILED = "failed"
+
+_sender_thread: threading.Thread | None = None
+_init_lock = threading.Lock()
+_initialized_path: str | None = None
+_stop_event = threading.Event()
+_wake_event = threading.Event()
+
+
+def get_outbox_dir() -> str:
+    outbox_dir = os.getenv("OUTBOX_DIR", "outbox")
+    os.makedirs(outbox_dir, exist_ok=True)
+    return outbox_dir
+
+
+def _outbox_path() -> str:
+    return os.path.join(os.getenv("OUTBOX_DIR", "outbox"), "outbox.sqlite3")
+
+
+def init_outbox() -> None:
+    global _initialized_path
+    with _init_lock:
+        path = os.path.join(get_outbox_dir(), "outbox.sqlite3")
+        conn = sqlite3.connect(path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_id TEXT NOT NULL UNIQUE,
+                    table_name TEXT NOT NULL,
+                    mappings TEXT NOT NULL,
+                    bulk_load TEXT,
+                    status TEXT NOT NULL,
+                    rows_queued INTEGER NOT NULL,
+                    rows_rejected INTEGER NOT NULL,
+                    rows_inserted INTEGER,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS batches (
+                    file_id TEXT NOT NULL,
+                    batch_no INTEGER NOT NULL,
+                    rows TEXT NOT NULL,
+                    PRIMARY KEY (file_id, batch_no)
+                );
+                """
+            )
+        finally:
+            conn.close()
+        _initialized_path = path
+
+
+def _connect() -> sqlite3.Connection:
+    path = _outbox_path()
+    if path != _initialized_path:
+        init_outbox()
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _encode_value(value):
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, date):
+        return {"$date": value.isoformat()}
+    raise TypeError(f"Cannot store {type(value).__name__} in outbox")
+
+
+def _decode_value(obj: dict):
+    if "$decimal" in obj:
+        return Decimal(obj["$decimal"])
+    if "$datetime" in obj:
+        return datetime.fromisoformat(obj["$datetime"])
+    if "$date" in obj:
+        return date.fromisoformat(obj["$date"])
+    return obj
+
+
+def _dump_rows(rows: list[tuple]) -> str:
+    return json.dumps(rows, default=_encode_value)
+
+
+def _load_rows(payload: str) -> list[tuple]:
+    return [tuple(row) for row in json.loads(payload, object_hook=_decode_value)]
+
+
+def _job_to_dict(row: sqlite3.Row) -> dict:
+    return {
+        "file_id": row["file_id"],
+        "table": row["table_name"],
+        "status": row["status"],
+        "rows_queued": row["rows_queued"],
+        "rows_rejected": row["rows_rejected"],
+        "rows_inserted": row["rows_inserted"],
+        "attempts": row["attempts"],
+        "last_error": row["last_error"],
+    }
+
+
+def get_job(file_id: str) -> dict | None:
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE file_id = ?", (file_id,)).fetchone()
+        return _job_to_dict(row) if row else None
+    finally:
+        conn.close()
+
+
+def enqueue_csv(
+    file_id: str,
+    file_path: str,
+    table: str,
+    mappings: list[dict],
+    chunk_size: int | None = None,
+    max_rejects: int | None = None,
+    max_reject_ratio: float | None = None,
+    rejects_path: str | None = None,
+    bulk_load: dict | None = None,
+) -> dict:
+    if not mappings:
+        raise ValueError("No mappings provided")
+
+    safe_table = sql_service.validate_table_name(table)
+    sql_service.validate_bulk_load(bulk_load)
+
+    existing = get_job(file_id)
+    if existing is not None:
+        return existing
+
+    stats = {}
+    batches = sql_service.convert_csv_batches(
+        file_path,
+        mappings,
+        chunk_size=chunk_size,
+        max_rejects=max_rejects,
+        max_reject_ratio=max_reject_ratio,
+        rejects_path=rejects_path,
+        stats=stats,
+    )
+
+    # The job row is claimed first as "staging" so the sender ignores it, then each
+    # batch is committed in its own short transaction to keep the write lock brief.
+    conn = _connect()
+    try:
+        now = time.time()
+        try:
+            with conn:
+                conn.execute(
+                    """
+                    INSERT INTO jobs (
+                        file_id, table_name, mappings, bulk_load, status, rows_queued,
+                        rows_rejected, next_attempt_at, created_at, updated_at
+                    )
+                    VALUES (?, ?, ?, ?, ?, 0, 0, ?, ?, ?)
+                    """,
+                    (
+                        file_id,
+                        safe_table,
+                        json.dumps(mappings),
+                        json.dumps(bulk_load) if bulk_load else None,
+                        STATUS_STAGING,
+                        now,
+                        now,
+                        now,
+                    ),
+                )
+        except sqlite3.IntegrityError:
+            # A concurrent request queued the same file_id first.
+            return get_job(file_id)
+
+        rows_queued = 0
+        try:
+            for batch_no, rows in enumerate(batches):
+                with conn:
+                    conn.execute(
+                        "INSERT INTO batches (file_id, batch_no, rows) VALUES (?, ?, ?)",
+                        (file_id, batch_no, _dump_rows(rows)),
+                    )
+                rows_queued += len(rows)
+        except Exception:
+            with conn:
+                conn.execute("DELETE FROM batches WHERE file_id = ?", (file_id,))
+                conn.execute("DELETE FROM jobs WHERE file_id = ?", (file_id,))
+            raise
+
+        with conn:
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = ?, rows_queued = ?, rows_rejected = ?, next_attempt_at = ?, updated_at = ?
+                WHERE file_id = ?
+                """,
+                (STATUS_PENDING, rows_queued, stats["rows_rejected"], time.time(), time.time(), file_id),
+            )
+    finally:
+        batches.close()
+        conn.close()
+
+    logger.info("Queued %d rows for %s in outbox job %s", rows_queued, safe_table, file_id)
+    _wake_event.set()
+    return get_job(file_id)
+
+
+def requeue_job(file_id: str) -> bool:
+    conn = _connect()
+    try:
+        with conn:
+            cursor = conn.execute(
+                """
+                UPDATE jobs
+                SET status = ?, attempts = 0, next_attempt_at = ?, last_error = NULL, updated_at = ?
+                WHERE file_id = ? AND status = ?
+                """,
+                (STATUS_PENDING, time.time(), time.time(), file_id, STATUS_FAILED),
+            )
+    finally:
+        conn.close()
+
+    if cursor.rowcount:
+        logger.info("Requeued outbox job %s", file_id)
+        _wake_event.set()
+    return bool(cursor.rowcount)
+
+
+def _iter_batches(conn: sqlite3.Connection, file_id: str):
+    cursor = conn.execute("SELECT rows FROM batches WHERE file_id = ? ORDER BY batch_no", (file_id,))
+    for row in cursor:
+        yield _load_rows(row["rows"])
+
+
+def _next_due_job(conn: sqlite3.Connection) -> sqlite3.Row | None:
+    return conn.execute(
+        """
+        SELECT * FROM jobs
+        WHERE status = ? AND next_attempt_at <= ?
+        ORDER BY seq
+        LIMIT 1
+        """,
+        (STATUS_PENDING, time.time()),
+    ).fetchone()
+
+
+def _max_attempts() -> int:
+    return int(os.getenv("OUTBOX_MAX_ATTEMPTS", "10"))
+
+
+def _retry_delay(attempts: int) -> float:
+    base = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "2"))
+    cap = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "300"))
+    return min(base * 2 ** (attempts - 1), cap)
+
+
+def deliver_next() -> bool:
+    conn = _connect()
+    try:
+        job = _next_due_job(conn)
+        if job is None:
+            return False
+
+        file_id = job["file_id"]
+        try:
+            rows_inserted = sql_service.deliver_batches(
+                file_id=file_id,
+                table=job["table_name"],
+                mappings=json.loads(job["mappings"]),
+                batches=_iter_batches(conn, file_id),
+                bulk_load=json.loads(job["bulk_load"]) if job["bulk_load"] else None,
+            )
+        except Exception as exc:
+            attempts = job["attempts"] + 1
+            status = STATUS_PENDING
+            delay = _retry_delay(attempts)
+            if attempts >= _max_attempts():
+                status = STATUS_FAILED
+                logger.error("Outbox job %s failed after %d attempts: %s", file_id, attempts, exc)
+            else:
+                logger.warning(
+                    "Outbox job %s failed (attempt %d), retrying in %.0fs: %s", file_id, attempts, delay, exc
+                )
+            with conn:
+                conn.execute(
+                    """
+                    UPDATE jobs
+                    SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, updated_at = ?
+                    WHERE file_id = ?
+                    """,
+                    (status, attempts, time.time() + delay, str(exc), time.time(), file_id),
+                )
+            return True
+
+        with conn:
+            conn.execute(
+                """
+                UPDATE jobs
+                SET status = ?, rows_inserted = ?, attempts = attempts + 1, last_error = NULL, updated_at = ?
+                WHERE file_id = ?
+                """,
+                (STATUS_DELIVERED, rows_inserted, time.time(), file_id),
+            )
+            conn.execute("DELETE FROM batches WHERE file_id = ?", (file_id,))
+        return True
+    finally:
+        conn.close()
+
+
+def _sender_loop() -> None:
+    poll_seconds = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+    while not _stop_event.is_set():
+        try:
+            if deliver_next():
+                continue
+        except Exception:
+            logger.exception("Outbox sender error")
+        _wake_event.wait(poll_seconds)
+        _wake_event.clear()
+
+
+def start_sender() -> None:
+    global _sender_thread
+    if _sender_thread is not None and _sender_thread.is_alive():
+        return
+    init_outbox()
+    _stop_event.clear()
+    _sender_thread = threading.Thread(target=_sender_loop, name="outbox-sender", daemon=True)
+    _sender_thread.start()
+
+
+def stop_sender(timeout: float = 10) -> None:
+    global _sender_thread
+    _stop_event.set()
+    _wake_event.set()
+    if _sender_thread is not None:
+        _sender_thread.join(timeout)
+        _sender_thread = None
@@ -1,6 +1,8 @@
+import csv
 import logging
 import os
 import re
+import uuid
 
 import pandas as pd
 import pyodbc
@@ -26,6 +28,11 @@ class ValidationError(Exception):
     pass
 
 
+REJECTS_HEADER = ["row_number", "column", "value", "reason"]
+BULK_LOAD_OPTIONS = ("tablock", "disable_indexes", "heap_staging")
+STAGING_BASE_MAX_LEN = 100
+
+
 def _connection_string() -> str:
     driver = os.getenv("SQLSERVER_DRIVER", "ODBC Driver 17 for SQL Server")
     host = os.getenv("SQLSERVER_HOST", "")
@@ -55,6 +62,10 @@ def _connection_string() -> str:
     )
 
 
+def _connect() -> pyodbc.Connection:
+    return pyodbc.connect(_connection_string())
+
+
 def _normalize_identifier(identifier: str) -> str:
     value = (identifier or "").strip()
     if value.startswith("[") and value.endswith("]"):
@@ -123,8 +134,62 @@ def _create_table_from_mappings(cursor: pyodbc.Cursor, table: str, mappings: lis
     cursor.execute(create_sql)
 
 
+def _quote_identifier(name: str) -> str:
+    return "[" + name.replace("]", "]]") + "]"
+
+
+def validate_bulk_load(bulk_load: dict | None) -> dict:
+    options = dict.fromkeys(BULK_LOAD_OPTIONS, False)
+    for key, value in (bulk_load or {}).items():
+        if key not in options:
+            raise ValidationError(f"Unknown bulk load option: {key}")
+        options[key] = bool(value)
+    return options
+
+
+def build_insert_sql(safe_table: str, target_cols: list[str], tablock: bool = False) -> str:
+    placeholders = ", ".join(["?"] * len(target_cols))
+    col_sql = ", ".join(f"[{c}]" for c in target_cols)
+    hint = " WITH (TABLOCK)" if tablock else ""
+    return f"INSERT INTO {safe_table}{hint} ({col_sql}) VALUES ({placeholders})"
+
+
+def _table_is_empty(cursor: pyodbc.Cursor, safe_table: str) -> bool:
+    cursor.execute(f"SELECT TOP 1 1 FROM {safe_table}")
+    return cursor.fetchone() is None
+
+
+def _disableable_indexes(cursor: pyodbc.Cursor, safe_table: str) -> list[str]:
+    # Only plain non-clustered indexes: disabling a clustered index makes the table
+    # unreadable, and unique indexes must keep enforcing their constraint during the load.
+    cursor.execute(
+        """
+        SELECT name
+        FROM sys.indexes
+        WHERE object_id = OBJECT_ID(?)
+          AND type = 2
+          AND is_disabled = 0
+          AND is_unique = 0
+          AND is_primary_key = 0
+          AND is_unique_constraint = 0
+        ORDER BY index_id
+        """,
+        safe_table,
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _create_staging_table(cursor: pyodbc.Cursor, safe_table: str, target_cols: list[str]) -> str:
+    schema_name, table_name = [part.strip("[]") for part in safe_table.split(".")]
+    # Truncate so the 19-character suffix stays within SQL Server's 128-character identifier limit.
+    staging_table = f"[{schema_name}].[{table_name[:STAGING_BASE_MAX_LEN]}_stage_{uuid.uuid4().hex[:12]}]"
+    col_sql = ", ".join(f"[{c}]" for c in target_cols)
+    cursor.execute(f"SELECT TOP 0 {col_sql} INTO {staging_table} FROM {safe_table}")
+    return staging_table
+
+
 def table_exists(table: str) -> bool:
-    conn = pyodbc.connect(_connection_string())
+    conn = _connect()
     try:
         cursor = conn.cursor()
         return _table_exists(cursor, table)
@@ -133,7 +198,7 @@ def table_exists(table: str) -> bool:
 
 
 def create_table_from_mappings(table: str, mappings: list[dict]) -> None:
-    conn = pyodbc.connect(_connection_string())
+    conn = _connect()
     conn.autocommit = False
     try:
         cursor = conn.cursor()
@@ -146,32 +211,39 @@ def create_table_from_mappings(table: str, mappings: list[dict]) -> None:
         conn.close()
 
 
-def insert_csv(file_path: str, table: str, mappings: list[dict], chunk_size: int | None = None) -> int:
-    if not mappings:
-        raise ValueError("No mappings provided")
+def convert_csv_batches(
+    file_path: str,
+    mappings: list[dict],
+    chunk_size: int | None = None,
+    max_rejects: int | None = None,
+    max_reject_ratio: float | None = None,
+    rejects_path: str | None = None,
+    stats: dict | None = None,
+):
+    reject_mode = max_rejects is not None or max_reject_ratio is not None
+    if reject_mode and not rejects_path:
+        raise ValueError("rejects_path is required when a reject limit is set")
 
-    safe_table = validate_table_name(table)
     if chunk_size is None:
         chunk_size = int(os.getenv("CHUNK_SIZE", "2000"))
+    ratio_min_rows = int(os.getenv("REJECT_RATIO_MIN_ROWS", "1000"))
+    if stats is None:
+        stats = {}
+    stats["rows_rejected"] = 0
 
-    target_cols = [validate_column_name(m["target_col"]) for m in mappings]
     csv_cols = [m["csv_col"] for m in mappings]
     target_types = [validate_target_type(m["target_type"]) for m in mappings]
 
-    placeholders = ", ".join(["?"] * len(target_cols))
-    col_sql = ", ".join(f"[{c}]" for c in target_cols)
-    insert_sql = f"INSERT INTO {safe_table} ({col_sql}) VALUES ({placeholders})"
-
-    total_inserted = 0
-    conn = pyodbc.connect(_connection_string())
-    conn.autocommit = False
+    total_rejected = 0
+    reject_samples = []
+    rejects_file = None
+    rejects_writer = None
 
     try:
-        cursor = conn.cursor()
-        cursor.fast_executemany = True
-
-        if not _table_exists(cursor, safe_table):
-            _create_table_from_mappings(cursor, safe_table, mappings)
+        if reject_mode:
+            rejects_file = open(rejects_path, "w", newline="", encoding="utf-8")
+            rejects_writer = csv.writer(rejects_file)
+            rejects_writer.writerow(REJECTS_HEADER)
 
         reader = pd.read_csv(
             file_path,
@@ -185,33 +257,197 @@ def insert_csv(file_path: str, table: str, mappings: list[dict], chunk_size: int
         for chunk in reader:
             rows = []
             errors = []
+            rejected_rows = []
 
             for idx, row in enumerate(chunk[csv_cols].itertuples(index=False, name=None)):
                 values = []
+                row_errors = []
                 row_num = processed + idx + 2
-                for val, target_type in zip(row, target_types):
+                for val, csv_col, target_type in zip(row, csv_cols, target_types):
                     try:
                         converted = type_casting.cast_value(val, target_type, nullable=True)
                         values.append(converted)
-                    except Exception as exc:  # pragma: no cover
-                        errors.append(f"Row {row_num}: {exc}")
-                        if len(errors) >= 10:
-                            break
-                if errors:
-                    break
+                    except Exception as exc:
+                        row_errors.append((row_num, csv_col, val, str(exc)))
+                if row_errors:
+                    if not reject_mode:
+                        errors.extend(f"Row {num}: {reason}" for num, _, _, reason in row_errors[:10])
+                        break
+                    rejected_rows.extend(row_errors)
+                    total_rejected += 1
+                    continue
                 rows.append(tuple(values))
 
             if errors:
                 raise ConversionError(errors)
 
-            if rows:
-                cursor.executemany(insert_sql, rows)
-                total_inserted += len(rows)
+            if rejected_rows:
+                rejects_writer.writerows(rejected_rows)
+                stats["rows_rejected"] = total_rejected
+                for num, csv_col, _, reason in rejected_rows:
+                    if len(reject_samples) >= 10:
+                        break
+                    reject_samples.append(f"Row {num} ({csv_col}): {reason}")
+                if max_rejects is not None and total_rejected > max_rejects:
+                    raise ConversionError([f"Reject limit exceeded: {total_rejected} rows rejected"] + reject_samples)
 
             processed += len(chunk)
+            if (
+                max_reject_ratio is not None
+                and processed >= ratio_min_rows
+                and total_rejected / processed > max_reject_ratio
+            ):
+                raise ConversionError(
+                    [f"Reject ratio exceeded: {total_rejected} of {processed} rows rejected"] + reject_samples
+                )
+
+            if rows:
+                yield rows
+
+        if max_reject_ratio is not None and processed and total_rejected / processed > max_reject_ratio:
+            raise ConversionError(
+                [f"Reject ratio exceeded: {total_rejected} of {processed} rows rejected"] + reject_samples
+            )
+    finally:
+        if rejects_file is not None:
+            rejects_file.close()
+            if total_rejected == 0:
+                os.remove(rejects_path)
+
+
+def _load_batches(cursor: pyodbc.Cursor, safe_table: str, mappings: list[dict], batches, bulk_options: dict) -> int:
+    target_cols = [validate_column_name(m["target_col"]) for m in mappings]
+    col_sql = ", ".join(f"[{c}]" for c in target_cols)
+
+    if not _table_exists(cursor, safe_table):
+        _create_table_from_mappings(cursor, safe_table, mappings)
+
+    staging_table = None
+    if bulk_options["heap_staging"] and _table_is_empty(cursor, safe_table):
+        staging_table = _create_staging_table(cursor, safe_table, target_cols)
+        insert_sql = build_insert_sql(staging_table, target_cols, tablock=True)
+    else:
+        insert_sql = build_insert_sql(safe_table, target_cols, tablock=bulk_options["tablock"])
+
+    disabled_indexes = []
+    if bulk_options["disable_indexes"]:
+        disabled_indexes = _disableable_indexes(cursor, safe_table)
+        for index_name in disabled_indexes:
+            cursor.execute(f"ALTER INDEX {_quote_identifier(index_name)} ON {safe_table} DISABLE")
+
+    total_inserted = 0
+    for rows in batches:
+        cursor.executemany(insert_sql, rows)
+        total_inserted += len(rows)
+
+    if staging_table:
+        cursor.execute(
+            f"INSERT INTO {safe_table} WITH (TABLOCK) ({col_sql}) SELECT {col_sql} FROM {staging_table}"
+        )
+        cursor.execute(f"DROP TABLE {staging_table}")
+
+    for index_name in disabled_indexes:
+        cursor.execute(f"ALTER INDEX {_quote_identifier(index_name)} ON {safe_table} REBUILD")
+
+    return total_inserted
+
+
+def insert_csv(
+    file_path: str,
+    table: str,
+    mappings: list[dict],
+    chunk_size: int | None = None,
+    max_rejects: int | None = None,
+    max_reject_ratio: float | None = None,
+    rejects_path: str | None = None,
+    bulk_load: dict | None = None,
+) -> dict:
+    if not mappings:
+        raise ValueError("No mappings provided")
+
+    safe_table = validate_table_name(table)
+    bulk_options = validate_bulk_load(bulk_load)
+
+    stats = {}
+    batches = convert_csv_batches(
+        file_path,
+        mappings,
+        chunk_size=chunk_size,
+        max_rejects=max_rejects,
+        max_reject_ratio=max_reject_ratio,
+        rejects_path=rejects_path,
+        stats=stats,
+    )
+
+    conn = _connect()
+    conn.autocommit = False
+
+    try:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        total_inserted = _load_batches(cursor, safe_table, mappings, batches, bulk_options)
+        conn.commit()
+        logger.info("Inserted %d rows into %s (%d rejected)", total_inserted, safe_table, stats["rows_rejected"])
+        return {"rows_inserted": total_inserted, "rows_rejected": stats["rows_rejected"]}
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        batches.close()
+        conn.close()
+
+
+def _ledger_table() -> str:
+    return validate_table_name(os.getenv("OUTBOX_LEDGER_TABLE", "dbo.csv_upload_ledger"))
+
+
+def _ensure_ledger(cursor: pyodbc.Cursor, ledger_table: str) -> None:
+    if not _table_exists(cursor, ledger_table):
+        cursor.execute(
+            f"""
+            CREATE TABLE {ledger_table} (
+                [file_id] NVARCHAR(64) NOT NULL PRIMARY KEY,
+                [target_table] NVARCHAR(300) NOT NULL,
+                [rows_inserted] BIGINT NOT NULL,
+                [delivered_at] DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+            )
+            """
+        )
+
+
+def deliver_batches(file_id: str, table: str, mappings: list[dict], batches, bulk_load: dict | None = None) -> int:
+    # The ledger row is written in the same transaction as the data, so a file_id
+    # that was committed before a crash is recognised and never inserted twice.
+    safe_table = validate_table_name(table)
+    bulk_options = validate_bulk_load(bulk_load)
+    ledger_table = _ledger_table()
+
+    conn = _connect()
+    conn.autocommit = False
 
+    try:
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        _ensure_ledger(cursor, ledger_table)
+        cursor.execute(
+            f"SELECT [rows_inserted] FROM {ledger_table} WITH (UPDLOCK, HOLDLOCK) WHERE [file_id] = ?",
+            file_id,
+        )
+        delivered = cursor.fetchone()
+        if delivered is not None:
+            conn.commit()
+            logger.info("Outbox job %s already delivered to %s", file_id, safe_table)
+            return int(delivered[0])
+
+        total_inserted = _load_batches(cursor, safe_table, mappings, batches, bulk_options)
+        cursor.execute(
+            f"INSERT INTO {ledger_table} ([file_id], [target_table], [rows_inserted]) VALUES (?, ?, ?)",
+            file_id,
+            safe_table,
+            total_inserted,
+        )
         conn.commit()
-        logger.info("Inserted %d rows into %s", total_inserted, safe_table)
+        logger.info("Delivered outbox job %s: %d rows into %s", file_id, total_inserted, safe_table)
         return total_inserted
     except Exception:
         conn.rollback()
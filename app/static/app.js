@@ -30,6 +30,8 @@ const preview = document.getElementById("preview");
 const mappingGrid = document.getElementById("mapping-grid");
 const tableNameInput = document.getElementById("table-name");
 const uploadResult = document.getElementById("upload-result");
+const maxRejectsInput = document.getElementById("max-rejects");
+const deferredInput = document.getElementById("deferred");
 
 function setStatus(text, tone = "neutral") {
   statusBody.textContent = text;
@@ -230,6 +232,8 @@ document.getElementById("run-upload").addEventListener("click", async () => {
   }
 
   const mappings = collectMappingsFromGrid();
+  const maxRejects = maxRejectsInput.value.trim();
+  const errorPolicy = maxRejects === "" ? null : { max_rejects: Number(maxRejects) };
 
   setStatus("Uploading to SQL Server...");
   const res = await fetch("/api/upload/run", {
@@ -239,6 +243,8 @@ document.getElementById("run-upload").addEventListener("click", async () => {
       file_id: state.fileId,
       table: state.table,
       mappings,
+      error_policy: errorPolicy,
+      deferred: deferredInput.checked,
     }),
   });
 
@@ -253,8 +259,25 @@ document.getElementById("run-upload").addEventListener("click", async () => {
     return;
   }
 
-  uploadResult.textContent = `Inserted ${data.rows_inserted} rows.`;
-  setStatus("Upload complete", "ok");
+  if (data.status === "queued" || data.status === "staging") {
+    uploadResult.textContent = `Queued ${data.rows_queued} rows; status at /api/upload/${state.fileId}/status.`;
+  } else if (data.status === "failed") {
+    uploadResult.textContent = `Delivery failed: ${data.message}. Retry with POST /api/upload/${state.fileId}/retry.`;
+  } else {
+    uploadResult.textContent = `Inserted ${data.rows_inserted} rows.`;
+  }
+  if (data.rows_rejected) {
+    uploadResult.textContent += ` Rejected ${data.rows_rejected} rows. `;
+    const link = document.createElement("a");
+    link.href = data.rejects_url;
+    link.textContent = "Download rejects CSV";
+    uploadResult.appendChild(link);
+  }
+  if (data.status === "failed") {
+    setStatus("Upload failed", "err");
+  } else {
+    setStatus(data.status === "queued" ? "Upload queued" : "Upload complete", "ok");
+  }
 });
 
 renderMappingGrid();
@@ -0,0 +1,133 @@
+import sys
+import types
+
+import pytest
+
+try:
+    import pyodbc  # noqa: F401
+except ImportError:
+    # The tests never open a real connection (sql_service._connect is patched), so a
+    # placeholder is enough when pyodbc or its ODBC driver manager is unavailable.
+    pyodbc = types.ModuleType("pyodbc")
+    pyodbc.Connection = object
+    pyodbc.Cursor = object
+
+    def _unavailable(*args, **kwargs):
+        raise RuntimeError("pyodbc is not available in the test environment")
+
+    pyodbc.connect = _unavailable
+    sys.modules["pyodbc"] = pyodbc
+
+
+class RecordingCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.fast_executemany = False
+        self._result = []
+
+    def execute(self, sql, *params):
+        statement = " ".join(sql.split())
+        self.conn.statements.append(statement)
+        self._result = self.conn.respond(statement, params)
+
+    def executemany(self, sql, rows):
+        statement = " ".join(sql.split())
+        if self.conn.fail_on_batch is not None and self.conn.batches_sent == self.conn.fail_on_batch:
+            raise RuntimeError("batch failed")
+        self.conn.batches_sent += 1
+        self.conn.statements.append(statement)
+        self.conn.batches.append(list(rows))
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+    def fetchall(self):
+        return list(self._result)
+
+
+class RecordingConnection:
+    """Stand-in for a pyodbc connection that records every statement it is given."""
+
+    def __init__(
+        self,
+        table_exists=True,
+        table_empty=False,
+        indexes=(),
+        ledger=None,
+        ledger_exists=True,
+        fail_on_batch=None,
+    ):
+        self.table_exists = table_exists
+        self.ledger_exists = ledger_exists
+        self.table_empty = table_empty
+        self.indexes = list(indexes)
+        self.ledger = ledger if ledger is not None else {}
+        self.fail_on_batch = fail_on_batch
+        self.autocommit = True
+        self.statements = []
+        self.batches = []
+        self.batches_sent = 0
+        self.committed = False
+        self.rolled_back = False
+        self._pending_ledger = {}
+
+    def respond(self, statement, params):
+        if "INFORMATION_SCHEMA.TABLES" in statement:
+            if params and params[1] == "csv_upload_ledger":
+                return [(1,)] if self.ledger_exists else []
+            return [(1,)] if self.table_exists else []
+        if statement.startswith("SELECT TOP 1 1 FROM"):
+            return [] if self.table_empty else [(1,)]
+        if "FROM sys.indexes" in statement:
+            return [(name,) for name in self.indexes]
+        if "WITH (UPDLOCK, HOLDLOCK)" in statement:
+            file_id = params[0]
+            return [(self.ledger[file_id],)] if file_id in self.ledger else []
+        if statement.startswith("CREATE TABLE [dbo].[csv_upload_ledger]"):
+            self.ledger_exists = True
+        if statement.startswith("INSERT INTO [dbo].[csv_upload_ledger]"):
+            self._pending_ledger[params[0]] = params[2]
+        return []
+
+    def cursor(self):
+        return RecordingCursor(self)
+
+    def commit(self):
+        self.committed = True
+        self.ledger.update(self._pending_ledger)
+        self._pending_ledger = {}
+
+    def rollback(self):
+        self.rolled_back = True
+        self._pending_ledger = {}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    from app.services import sql_service
+
+    connections = []
+
+    def install(**options):
+        def _connect():
+            conn = RecordingConnection(**options)
+            connections.append(conn)
+            return conn
+
+        monkeypatch.setattr(sql_service, "_connect", _connect)
+        return connections
+
+    return install
+
+
+@pytest.fixture
+def write_csv(tmp_path):
+    def _write(text, name="upload.csv"):
+        path = tmp_path / name
+        path.write_text(text, encoding="utf-8")
+        return str(path)
+
+    return _write
@@ -0,0 +1,221 @@
+import sqlite3
+import time
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.upload_routes import router as upload_router
+from app.services import outbox_service, sql_service
+
+FILE_ID = "0b6f1e0e-8d4c-4b53-9a57-5c1f6f0c2d11"
+MAPPINGS = [
+    {"target_col": "Id", "csv_col": "id", "target_type": "INT"},
+    {"target_col": "Amount", "csv_col": "amount", "target_type": "DECIMAL(18,2)"},
+    {"target_col": "Day", "csv_col": "day", "target_type": "DATE"},
+]
+CSV_TEXT = "id,amount,day\n1,1.50,2024-01-01\n2,2.50,2024-01-02\n3,3.50,2024-01-03\n4,4.50,2024-01-04\n5,5.50,2024-01-05\n"
+
+
+@pytest.fixture(autouse=True)
+def outbox_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("OUTBOX_DIR", str(tmp_path / "outbox"))
+    monkeypatch.setenv("OUTBOX_RETRY_BASE_SECONDS", "0")
+    return tmp_path / "outbox"
+
+
+def _enqueue(write_csv, text=CSV_TEXT):
+    return outbox_service.enqueue_csv(FILE_ID, write_csv(text), "dbo.T", MAPPINGS, chunk_size=2)
+
+
+def _set_status(status):
+    conn = sqlite3.connect(outbox_service._outbox_path())
+    with conn:
+        conn.execute("UPDATE jobs SET status = ?", (status,))
+    conn.close()
+
+
+def test_batches_are_sent_in_order(connect, write_csv):
+    connections = connect()
+    job = _enqueue(write_csv)
+    assert job["status"] == outbox_service.STATUS_PENDING
+    assert job["rows_queued"] == 5
+
+    assert outbox_service.deliver_next() is True
+
+    conn = connections[0]
+    assert conn.committed
+    assert conn.batches == [
+        [(1, Decimal("1.50"), date(2024, 1, 1)), (2, Decimal("2.50"), date(2024, 1, 2))],
+        [(3, Decimal("3.50"), date(2024, 1, 3)), (4, Decimal("4.50"), date(2024, 1, 4))],
+        [(5, Decimal("5.50"), date(2024, 1, 5))],
+    ]
+    job = outbox_service.get_job(FILE_ID)
+    assert job["status"] == outbox_service.STATUS_DELIVERED
+    assert job["rows_inserted"] == 5
+    assert outbox_service.deliver_next() is False
+
+
+def test_failed_attempt_schedules_retry(connect, write_csv, monkeypatch):
+    monkeypatch.setenv("OUTBOX_RETRY_BASE_SECONDS", "30")
+    connections = connect(fail_on_batch=1)
+    _enqueue(write_csv)
+
+    before = time.time()
+    assert outbox_service.deliver_next() is True
+
+    assert connections[0].rolled_back
+    job = outbox_service.get_job(FILE_ID)
+    assert job["status"] == outbox_service.STATUS_PENDING
+    assert job["attempts"] == 1
+    assert job["last_error"] == "batch failed"
+    conn = sqlite3.connect(outbox_service._outbox_path())
+    (next_attempt_at,) = conn.execute("SELECT next_attempt_at FROM jobs").fetchone()
+    conn.close()
+    assert next_attempt_at >= before + 30
+    assert outbox_service.deliver_next() is False
+
+
+def test_job_fails_after_max_attempts(connect, write_csv, monkeypatch):
+    monkeypatch.setenv("OUTBOX_MAX_ATTEMPTS", "2")
+    connect(fail_on_batch=0)
+    _enqueue(write_csv)
+
+    assert outbox_service.deliver_next() is True
+    assert outbox_service.get_job(FILE_ID)["status"] == outbox_service.STATUS_PENDING
+    assert outbox_service.deliver_next() is True
+
+    job = outbox_service.get_job(FILE_ID)
+    assert job["status"] == outbox_service.STATUS_FAILED
+    assert job["attempts"] == 2
+    assert outbox_service.deliver_next() is False
+
+
+def test_retry_after_ledger_commit_does_not_reinsert(connect, write_csv):
+    ledger = {}
+    connections = connect(ledger=ledger)
+    _enqueue(write_csv)
+    assert outbox_service.deliver_next() is True
+    assert ledger == {FILE_ID: 5}
+
+    # Simulate a crash between the SQL Server commit and the local status update.
+    _set_status(outbox_service.STATUS_PENDING)
+    assert outbox_service.deliver_next() is True
+
+    retry = connections[1]
+    assert retry.batches == []
+    assert not any(s.startswith("INSERT INTO [dbo].[T]") for s in retry.statements)
+    job = outbox_service.get_job(FILE_ID)
+    assert job["status"] == outbox_service.STATUS_DELIVERED
+    assert job["rows_inserted"] == 5
+
+
+def test_conversion_failure_leaves_no_job(connect, write_csv):
+    connect()
+    with pytest.raises(sql_service.ConversionError):
+        _enqueue(write_csv, "id,amount,day\n1,1.50,2024-01-01\n1,2.50,2024-01-02\n3,3.50,bad\n")
+
+    assert outbox_service.get_job(FILE_ID) is None
+    conn = sqlite3.connect(outbox_service._outbox_path())
+    assert conn.execute("SELECT COUNT(*) FROM batches").fetchone() == (0,)
+    conn.close()
+
+
+def test_duplicate_enqueue_returns_existing_job(connect, write_csv, monkeypatch):
+    connect()
+    first = _enqueue(write_csv)
+
+    real_get_job = outbox_service.get_job
+    calls = []
+
+    def racing_get_job(file_id):
+        # The first lookup misses, as if another request had not committed yet.
+        calls.append(file_id)
+        return None if len(calls) == 1 else real_get_job(file_id)
+
+    monkeypatch.setattr(outbox_service, "get_job", racing_get_job)
+    second = _enqueue(write_csv)
+
+    assert second == first
+
+
+def test_staging_job_does_not_hold_write_lock(connect, write_csv, monkeypatch):
+    connections = connect()
+    real_convert = sql_service.convert_csv_batches
+    observed = []
+
+    def slow_convert(*args, **kwargs):
+        for rows in real_convert(*args, **kwargs):
+            yield rows
+            observed.append(outbox_service.get_job(FILE_ID)["status"])
+            assert outbox_service.deliver_next() is False
+            other = sqlite3.connect(outbox_service._outbox_path(), timeout=0.1)
+            with other:
+                other.execute("UPDATE jobs SET updated_at = updated_at WHERE file_id = ?", ("other",))
+            other.close()
+
+    monkeypatch.setattr(sql_service, "convert_csv_batches", slow_convert)
+    job = _enqueue(write_csv)
+
+    assert observed == [outbox_service.STATUS_STAGING] * 3
+    assert connections == []
+    assert job["status"] == outbox_service.STATUS_PENDING
+    assert job["rows_queued"] == 5
+
+
+def _client():
+    app = FastAPI()
+    app.include_router(upload_router, prefix="/api")
+    return TestClient(app)
+
+
+def test_failed_job_can_be_requeued(connect, write_csv, monkeypatch):
+    monkeypatch.setenv("OUTBOX_MAX_ATTEMPTS", "1")
+    connect(fail_on_batch=0)
+    _enqueue(write_csv)
+    assert outbox_service.deliver_next() is True
+    assert outbox_service.get_job(FILE_ID)["status"] == outbox_service.STATUS_FAILED
+    assert outbox_service.requeue_job(FILE_ID) is True
+
+    job = outbox_service.get_job(FILE_ID)
+    assert job["status"] == outbox_service.STATUS_PENDING
+    assert job["attempts"] == 0
+    assert job["last_error"] is None
+
+    connections = connect()
+    assert outbox_service.deliver_next() is True
+    assert connections[-1].batches[0][0][0] == 1
+    assert outbox_service.get_job(FILE_ID)["status"] == outbox_service.STATUS_DELIVERED
+    assert outbox_service.requeue_job(FILE_ID) is False
+
+
+def test_retry_route(connect, write_csv, monkeypatch):
+    monkeypatch.setenv("OUTBOX_MAX_ATTEMPTS", "1")
+    client = _client()
+    assert client.post(f"/api/upload/{FILE_ID}/retry").status_code == 404
+
+    connect(fail_on_batch=0)
+    _enqueue(write_csv)
+    assert client.post(f"/api/upload/{FILE_ID}/retry").status_code == 409
+
+    outbox_service.deliver_next()
+    response = client.post(f"/api/upload/{FILE_ID}/retry")
+    assert response.status_code == 200
+    assert response.json()["status"] == outbox_service.STATUS_PENDING
+    assert response.json()["attempts"] == 0
+
+
+def test_repeated_deferred_run_returns_job_status(connect, write_csv, tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOAD_DIR", str(tmp_path / "uploads"))
+    connect()
+    _enqueue(write_csv)
+    outbox_service.deliver_next()
+
+    body = {"file_id": FILE_ID, "table": "dbo.T", "mappings": [], "deferred": True}
+    response = _client().post("/api/upload/run", json=body)
+
+    assert response.status_code == 200
+    assert response.json()["status"] == outbox_service.STATUS_DELIVERED
+    assert response.json()["rows_inserted"] == 5
@@ -0,0 +1,246 @@
+import csv
+import uuid
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.upload_routes import router as upload_router
+from app.services import sql_service
+
+MAPPINGS = [
+    {"target_col": "Id", "csv_col": "id", "target_type": "INT"},
+    {"target_col": "Name", "csv_col": "name", "target_type": "NVARCHAR(50)"},
+]
+CSV_TEXT = "id,name\n1,a\n2,b\n3,c\n"
+BAD_CSV_TEXT = "id,name\n1,a\nx,b\n3,c\ny,d\n"
+
+
+def _index_of(statements, prefix):
+    return next(i for i, s in enumerate(statements) if s.startswith(prefix))
+
+
+def test_build_insert_sql_tablock():
+    sql = sql_service.build_insert_sql("[dbo].[T]", ["Id", "Name"], tablock=True)
+    assert sql == "INSERT INTO [dbo].[T] WITH (TABLOCK) ([Id], [Name]) VALUES (?, ?)"
+
+
+def test_insert_csv_applies_tablock_hint(connect, write_csv):
+    connections = connect()
+    result = sql_service.insert_csv(write_csv(CSV_TEXT), "dbo.T", MAPPINGS, bulk_load={"tablock": True})
+
+    conn = connections[0]
+    assert result == {"rows_inserted": 3, "rows_rejected": 0}
+    assert "INSERT INTO [dbo].[T] WITH (TABLOCK) ([Id], [Name]) VALUES (?, ?)" in conn.statements
+    assert conn.committed
+
+
+def test_insert_csv_disables_indexes_around_load(connect, write_csv):
+    connections = connect(indexes=["IX_Name", "IX]Odd"])
+    sql_service.insert_csv(write_csv(CSV_TEXT), "dbo.T", MAPPINGS, chunk_size=2, bulk_load={"disable_indexes": True})
+
+    statements = connections[0].statements
+    disable = [s for s in statements if s.endswith("DISABLE")]
+    rebuild = [s for s in statements if s.endswith("REBUILD")]
+    inserts = [i for i, s in enumerate(statements) if s.startswith("INSERT INTO [dbo].[T]")]
+    assert disable == [
+        "ALTER INDEX [IX_Name] ON [dbo].[T] DISABLE",
+        "ALTER INDEX [IX]]Odd] ON [dbo].[T] DISABLE",
+    ]
+    assert rebuild == [
+        "ALTER INDEX [IX_Name] ON [dbo].[T] REBUILD",
+        "ALTER INDEX [IX]]Odd] ON [dbo].[T] REBUILD",
+    ]
+    assert len(inserts) == 2
+    assert statements.index(disable[-1]) < inserts[0]
+    assert inserts[-1] < statements.index(rebuild[0])
+
+
+def test_insert_csv_stages_empty_target_through_heap(connect, write_csv):
+    connections = connect(table_empty=True)
+    sql_service.insert_csv(write_csv(CSV_TEXT), "dbo.T", MAPPINGS, bulk_load={"heap_staging": True})
+
+    statements = connections[0].statements
+    create = _index_of(statements, "SELECT TOP 0 [Id], [Name] INTO [dbo].[T_stage_")
+    stage_table = statements[create].split(" INTO ")[1].split(" FROM ")[0]
+    load = statements.index(f"INSERT INTO {stage_table} WITH (TABLOCK) ([Id], [Name]) VALUES (?, ?)")
+    flush = statements.index(
+        f"INSERT INTO [dbo].[T] WITH (TABLOCK) ([Id], [Name]) SELECT [Id], [Name] FROM {stage_table}"
+    )
+    drop = statements.index(f"DROP TABLE {stage_table}")
+    assert create < load < flush < drop
+
+
+def test_staging_table_name_fits_identifier_limit(connect, write_csv):
+    table = "dbo." + "T" * 128
+    connections = connect(table_empty=True)
+    sql_service.insert_csv(write_csv(CSV_TEXT), table, MAPPINGS, bulk_load={"heap_staging": True})
+
+    create = next(s for s in connections[0].statements if s.startswith("SELECT TOP 0"))
+    stage_name = create.split(" INTO [dbo].[")[1].split("]")[0]
+    assert len(stage_name) <= 128
+
+
+def test_insert_csv_skips_staging_for_non_empty_target(connect, write_csv):
+    connections = connect(table_empty=False)
+    sql_service.insert_csv(write_csv(CSV_TEXT), "dbo.T", MAPPINGS, bulk_load={"heap_staging": True})
+
+    statements = connections[0].statements
+    assert not any("_stage_" in s for s in statements)
+    assert "INSERT INTO [dbo].[T] ([Id], [Name]) VALUES (?, ?)" in statements
+
+
+def test_insert_csv_rolls_back_without_rebuild_when_batch_fails(connect, write_csv):
+    connections = connect(indexes=["IX_Name"], fail_on_batch=1)
+    with pytest.raises(RuntimeError):
+        sql_service.insert_csv(
+            write_csv(CSV_TEXT), "dbo.T", MAPPINGS, chunk_size=2, bulk_load={"disable_indexes": True}
+        )
+
+    conn = connections[0]
+    assert conn.rolled_back
+    assert not conn.committed
+    assert "ALTER INDEX [IX_Name] ON [dbo].[T] DISABLE" in conn.statements
+    assert not any(s.endswith("REBUILD") for s in conn.statements)
+
+
+def test_unknown_bulk_load_option_is_rejected():
+    with pytest.raises(sql_service.ValidationError):
+        sql_service.validate_bulk_load({"nolock": True})
+
+
+def test_deliver_batches_creates_ledger_table_and_records_file(connect):
+    connections = connect(ledger_exists=False)
+    rows = [[(1, "a"), (2, "b")]]
+    inserted = sql_service.deliver_batches("file-1", "dbo.T", MAPPINGS, iter(rows))
+
+    conn = connections[0]
+    assert inserted == 2
+    create = _index_of(conn.statements, "CREATE TABLE [dbo].[csv_upload_ledger]")
+    record = _index_of(conn.statements, "INSERT INTO [dbo].[csv_upload_ledger]")
+    assert create < record
+    assert conn.ledger == {"file-1": 2}
+
+
+def _read_rejects(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.reader(f))
+
+
+def test_reject_mode_skips_bad_rows_and_writes_rejects(connect, write_csv, tmp_path):
+    connections = connect()
+    rejects_path = str(tmp_path / "rejects.csv")
+    result = sql_service.insert_csv(
+        write_csv(BAD_CSV_TEXT), "dbo.T", MAPPINGS, chunk_size=2, max_rejects=5, rejects_path=rejects_path
+    )
+
+    conn = connections[0]
+    assert result == {"rows_inserted": 2, "rows_rejected": 2}
+    assert conn.batches == [[(1, "a")], [(3, "c")]]
+    assert conn.committed
+    rejects = _read_rejects(rejects_path)
+    assert rejects[0] == sql_service.REJECTS_HEADER
+    assert [row[:3] for row in rejects[1:]] == [["3", "id", "x"], ["5", "id", "y"]]
+    assert "invalid literal for int()" in rejects[1][3]
+
+
+def test_reject_limit_exceeded_rolls_back(connect, write_csv, tmp_path):
+    connections = connect()
+    with pytest.raises(sql_service.ConversionError) as exc_info:
+        sql_service.insert_csv(
+            write_csv(BAD_CSV_TEXT),
+            "dbo.T",
+            MAPPINGS,
+            chunk_size=2,
+            max_rejects=1,
+            rejects_path=str(tmp_path / "rejects.csv"),
+        )
+
+    conn = connections[0]
+    assert conn.rolled_back
+    assert not conn.committed
+    assert exc_info.value.details[0] == "Reject limit exceeded: 2 rows rejected"
+    assert exc_info.value.details[1].startswith("Row 3 (id): ")
+
+
+def test_reject_ratio_checked_per_chunk_after_min_rows(connect, write_csv, tmp_path, monkeypatch):
+    monkeypatch.setenv("REJECT_RATIO_MIN_ROWS", "2")
+    connections = connect()
+    with pytest.raises(sql_service.ConversionError) as exc_info:
+        sql_service.insert_csv(
+            write_csv("id,name\nx,a\ny,b\n3,c\n4,d\n"),
+            "dbo.T",
+            MAPPINGS,
+            chunk_size=2,
+            max_reject_ratio=0.5,
+            rejects_path=str(tmp_path / "rejects.csv"),
+        )
+
+    conn = connections[0]
+    assert exc_info.value.details[0] == "Reject ratio exceeded: 2 of 2 rows rejected"
+    assert conn.batches == []
+    assert conn.rolled_back
+
+
+def test_reject_ratio_checked_at_end_of_file(connect, write_csv, tmp_path):
+    connections = connect()
+    with pytest.raises(sql_service.ConversionError) as exc_info:
+        sql_service.insert_csv(
+            write_csv(BAD_CSV_TEXT),
+            "dbo.T",
+            MAPPINGS,
+            chunk_size=2,
+            max_reject_ratio=0.25,
+            rejects_path=str(tmp_path / "rejects.csv"),
+        )
+
+    conn = connections[0]
+    assert exc_info.value.details[0] == "Reject ratio exceeded: 2 of 4 rows rejected"
+    assert len(conn.batches) == 2
+    assert conn.rolled_back
+    assert not conn.committed
+
+
+def test_reject_ratio_within_limit_commits(connect, write_csv, tmp_path):
+    connect()
+    result = sql_service.insert_csv(
+        write_csv(BAD_CSV_TEXT),
+        "dbo.T",
+        MAPPINGS,
+        chunk_size=2,
+        max_reject_ratio=0.5,
+        rejects_path=str(tmp_path / "rejects.csv"),
+    )
+
+    assert result == {"rows_inserted": 2, "rows_rejected": 2}
+
+
+def test_empty_rejects_file_is_removed(connect, write_csv, tmp_path):
+    connect()
+    rejects_path = tmp_path / "rejects.csv"
+    result = sql_service.insert_csv(
+        write_csv(CSV_TEXT), "dbo.T", MAPPINGS, max_rejects=5, rejects_path=str(rejects_path)
+    )
+
+    assert result["rows_rejected"] == 0
+    assert not rejects_path.exists()
+
+
+def test_rejects_routes_download_and_delete(tmp_path, monkeypatch):
+    monkeypatch.setenv("UPLOAD_DIR", str(tmp_path))
+    file_id = str(uuid.uuid4())
+    rejects_path = tmp_path / f"{file_id}.rejects.csv"
+    rejects_path.write_text("row_number,column,value,reason\n3,id,x,bad\n", encoding="utf-8")
+
+    app = FastAPI()
+    app.include_router(upload_router, prefix="/api")
+    client = TestClient(app)
+
+    response = client.get(f"/api/upload/{file_id}/rejects")
+    assert response.status_code == 200
+    assert response.text.splitlines()[1] == "3,id,x,bad"
+
+    assert client.delete(f"/api/upload/{file_id}/rejects").status_code == 200
+    assert not rejects_path.exists()
+    assert client.get(f"/api/upload/{file_id}/rejects").status_code == 404
+    assert client.get("/api/upload/not-a-uuid/rejects").status_code == 400